@@ -0,0 +1,289 @@
+"""
+TEST DE CHARGE - Simulation d'une classe qui utilise le chatbot
+================================================================
+
+Rejoue des sessions d'élèves (/chat -> /feedback -> /apprendre) et des
+rafales de /importer_base avec plusieurs élèves en parallèle, puis affiche
+le débit, les latences (p50/p95/p99) et le taux d'erreurs par route.
+
+Par défaut l'application tourne dans ce processus (client de test Flask)
+sur une copie temporaire de la base : on peut alors vérifier que chaque
+vote 👍 a bien été compté sur la bonne question. Avec --url, on vise un
+serveur déjà lancé (la vérification des votes n'est pas possible).
+
+Exemples :
+    python charge_classe.py --eleves 30 --sessions 20
+    python charge_classe.py --url http://localhost:5027 --eleves 50
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DOSSIER_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+PREFIXE_VARIANTE = "Je pense que vous voulez dire : '"
+
+
+# =============================================
+# CLIENTS
+# =============================================
+
+class ClientLocal:
+    """Appelle l'application Flask dans ce processus"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def appeler(self, methode, route, donnees=None):
+        if methode == 'GET':
+            r = self.client.get(route)
+        else:
+            r = self.client.post(route, json=donnees)
+        return r.status_code, r.get_json(silent=True)
+
+
+class ClientHttp:
+    """Appelle un serveur déjà lancé"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def appeler(self, methode, route, donnees=None):
+        corps = json.dumps(donnees).encode('utf-8') if donnees is not None else None
+        req = urllib.request.Request(self.url + route, data=corps, method=methode,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as r:
+                return r.status, json.loads(r.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+# =============================================
+# SIMULATION
+# =============================================
+
+class Resultats:
+    """Latences et erreurs par route, votes envoyés par question, exceptions des élèves"""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.latences = {}
+        self.erreurs = {}
+        self.votes = {}
+        self.exceptions = []
+
+    def noter(self, route, duree, erreur):
+        with self.verrou:
+            self.latences.setdefault(route, []).append(duree)
+            if erreur:
+                self.erreurs[route] = self.erreurs.get(route, 0) + 1
+
+    def noter_vote(self, question, reponse):
+        cle = (question.lower().strip(), reponse)
+        with self.verrou:
+            self.votes[cle] = self.votes.get(cle, 0) + 1
+
+    def noter_exception(self, exception):
+        """Un élève s'est arrêté sur une exception (réponse inattendue du serveur...)"""
+        with self.verrou:
+            self.exceptions.append(exception)
+
+
+def appeler(client, resultats, methode, route, donnees=None):
+    debut = time.perf_counter()
+    try:
+        statut, corps = client.appeler(methode, route, donnees)
+    except Exception:
+        statut, corps = 0, None
+    erreur = statut >= 400 or statut == 0 or (isinstance(corps, dict) and corps.get('success') is False)
+    resultats.noter(route, time.perf_counter() - debut, erreur)
+    return corps if not erreur else None
+
+
+def reponse_brute(texte):
+    """Retire le préfixe « Je pense que vous voulez dire » d'une réponse de variante"""
+    if texte.startswith(PREFIXE_VARIANTE) and '\n\n' in texte:
+        return texte.split('\n\n', 1)[1]
+    return texte
+
+
+def session_eleve(client, resultats, questions, args, numero):
+    """Une session : une question, un vote 👍, et on apprend si le bot ne sait pas"""
+    alea = random.Random(args.graine + numero)
+    if questions and alea.random() >= args.inconnues:
+        question = alea.choice(questions)
+    else:
+        question = f"question inconnue {alea.randrange(args.vocabulaire)}"
+
+    corps = appeler(client, resultats, 'POST', '/chat', {'message': question})
+    if not corps:
+        return
+
+    if corps.get('type') == 'apprentissage':
+        appeler(client, resultats, 'POST', '/apprendre',
+                {'question': question, 'reponse': f"réponse {numero}"})
+    else:
+        reponse = corps['reponse']
+        if appeler(client, resultats, 'POST', '/feedback',
+                   {'question': question, 'reponse': reponse, 'positif': True}):
+            resultats.noter_vote(question, reponse_brute(reponse))
+
+    if args.pause:
+        time.sleep(alea.uniform(0, args.pause / 1000))
+
+
+def eleve(client, resultats, questions, args, indice):
+    for n in range(args.sessions):
+        numero = indice * args.sessions + n
+        session_eleve(client, resultats, questions, args, numero)
+        if args.import_toutes and numero % args.import_toutes == args.import_toutes - 1:
+            for _ in range(args.rafale):
+                appeler(client, resultats, 'POST', '/importer_base')
+    appeler(client, resultats, 'GET', '/statistiques')
+
+
+# =============================================
+# RAPPORT
+# =============================================
+
+def centile(valeurs, p):
+    if not valeurs:
+        return 0.0
+    return valeurs[min(len(valeurs) - 1, int(p / 100 * len(valeurs)))]
+
+
+def afficher_rapport(resultats, duree):
+    total = sum(len(v) for v in resultats.latences.values())
+    erreurs = sum(resultats.erreurs.values()) + len(resultats.exceptions)
+    print("\n" + "=" * 72)
+    print(f"📈 {total} requêtes en {duree:.2f} s -> {total / duree:.1f} req/s, "
+          f"{erreurs} erreurs ({100 * erreurs / max(total, 1):.2f} %)")
+    print("=" * 72)
+    print(f"{'route':<16}{'requêtes':>10}{'erreurs':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route in sorted(resultats.latences):
+        valeurs = sorted(resultats.latences[route])
+        print(f"{route:<16}{len(valeurs):>10}{resultats.erreurs.get(route, 0):>9}"
+              f"{1000 * centile(valeurs, 50):>10.2f}{1000 * centile(valeurs, 95):>10.2f}"
+              f"{1000 * centile(valeurs, 99):>10.2f}{1000 * valeurs[-1]:>10.2f}")
+    if resultats.exceptions:
+        print(f"💥 {len(resultats.exceptions)} élèves arrêtés par une exception, par exemple :")
+        for exception in resultats.exceptions[:5]:
+            print(f"   {exception!r}")
+
+
+def verifier_votes(resultats, bot, scores_avant):
+    """Compare les votes envoyés aux scores enregistrés.
+
+    Le bot attribue chaque vote à sa dernière question posée (état partagé
+    entre tous les élèves) : si un autre élève a posé une question entre-temps,
+    le vote part sur la mauvaise question ou est perdu.
+    """
+    perdus = 0
+    for (question, reponse), nb_votes in resultats.votes.items():
+        reponses = bot.memoire.get(question, [])
+        avant = scores_avant.get((question, reponse))
+        if reponse not in reponses:
+            perdus += nb_votes
+            continue
+        score = bot.scores[question][reponses.index(reponse)]
+        # Une réponse apparue pendant le test part de 1 (apprise, importée,
+        # ou créée par un premier vote qui lui donne 2)
+        attendu = (avant if avant is not None else 1) + nb_votes
+        perdus += max(0, attendu - score)
+
+    total = sum(resultats.votes.values())
+    if perdus:
+        print(f"⚠️  {perdus}/{total} votes 👍 perdus ou attribués à une autre question "
+              f"(état partagé derniere_question)")
+    else:
+        print(f"✅ {total} votes 👍 tous comptés sur la bonne question")
+
+
+# =============================================
+# LANCEMENT
+# =============================================
+
+def charger_questions(fichier_csv):
+    if not os.path.exists(fichier_csv):
+        return []
+    with open(fichier_csv, 'r', encoding='utf-8') as f:
+        return [ligne['question'].strip() for ligne in csv.DictReader(f) if ligne.get('question')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge du chatbot (classe simulée)")
+    parser.add_argument('--url', help="serveur à viser (par défaut : application dans ce processus)")
+    parser.add_argument('--eleves', type=int, default=20, help="élèves en parallèle")
+    parser.add_argument('--sessions', type=int, default=20, help="sessions par élève")
+    parser.add_argument('--inconnues', type=float, default=0.2,
+                        help="proportion de questions que le bot ne connaît pas")
+    parser.add_argument('--vocabulaire', type=int, default=200, help="nombre de questions inconnues différentes")
+    parser.add_argument('--import-toutes', type=int, default=0,
+                        help="une rafale de /importer_base toutes les N sessions (0 : jamais)")
+    parser.add_argument('--rafale', type=int, default=3, help="appels /importer_base par rafale")
+    parser.add_argument('--pause', type=float, default=0, help="pause max entre deux sessions (ms)")
+    parser.add_argument('--csv', default=os.path.join(DOSSIER_SCRIPT, 'base_connaissances.csv'),
+                        help="questions posées par les élèves")
+    parser.add_argument('--memoire', default=os.path.join(DOSSIER_SCRIPT, 'mon_chatbot_double.json'),
+                        help="base de départ (copiée, jamais modifiée)")
+    parser.add_argument('--graine', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    questions = charger_questions(args.csv)
+    bot = None
+    scores_avant = {}
+
+    if args.url:
+        client = ClientHttp(args.url)
+    else:
+        # Tout se passe dans un dossier temporaire : la vraie base n'est pas touchée
+        dossier_initial = os.getcwd()
+        dossier = tempfile.mkdtemp(prefix='charge_classe_')
+        if os.path.exists(args.csv):
+            shutil.copy(args.csv, os.path.join(dossier, 'base_connaissances.csv'))
+        if os.path.exists(args.memoire):
+            shutil.copy(args.memoire, os.path.join(dossier, 'mon_chatbot_double.json'))
+        os.chdir(dossier)
+        sys.path.insert(0, DOSSIER_SCRIPT)
+        import chatbot_eleve
+
+        bot = chatbot_eleve.initialiser_application()
+        client = ClientLocal(chatbot_eleve.app)
+        scores_avant = {(q, r): s for q in bot.memoire for r, s in zip(bot.memoire[q], bot.scores[q])}
+
+    print(f"🏫 {args.eleves} élèves x {args.sessions} sessions"
+          f"{' sur ' + args.url if args.url else ' (application locale)'}")
+
+    resultats = Resultats()
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.eleves) as executeur:
+        futurs = [executeur.submit(eleve, client, resultats, questions, args, indice)
+                  for indice in range(args.eleves)]
+        for futur in futurs:
+            try:
+                futur.result()
+            except Exception as e:
+                resultats.noter_exception(e)
+    duree = time.perf_counter() - debut
+
+    afficher_rapport(resultats, duree)
+    if bot is not None:
+        chatbot_eleve.vider_tampons()
+        verifier_votes(resultats, bot, scores_avant)
+        os.chdir(dossier_initial)
+        shutil.rmtree(dossier, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
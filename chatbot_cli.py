@@ -0,0 +1,200 @@
+"""
+CHATBOT EN LIGNE DE COMMANDE
+============================
+
+Outils qui travaillent sur une base sans lancer le serveur web.
+
+    python chatbot_cli.py exporter mon_chatbot_double.json base.cbdb
+    python chatbot_cli.py importer base.cbdb mon_chatbot_double.json
+    python chatbot_cli.py comparer mon_chatbot_double.json
+    python chatbot_cli.py interroger --memoire mon_chatbot_double.json questions.txt
+    python chatbot_cli.py evaluer --memoire mon_chatbot_double.json tests.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from contextlib import redirect_stdout
+
+# Les messages du chatbot vont sur la sortie d'erreur : la sortie standard
+# reste réservée aux résultats (lignes JSON)
+with redirect_stdout(sys.stderr):
+    from chatbot_eleve import (ChatBotDoubleMode, encoder_compact, decoder_compact, ecrire_sauvegarde,
+                               encoder_sauvegarde, lire_sauvegarde)
+
+
+# =============================================
+# SAUVEGARDES
+# =============================================
+
+def exporter(args):
+    """Convertit une sauvegarde (JSON ou compacte) au format compact"""
+    data = lire_sauvegarde(args.source)
+    contenu = encoder_compact(data, compresser=not args.sans_compression)
+    octets = ecrire_sauvegarde(args.destination, contenu)
+    print(f"✅ {len(data['memoire'])} questions exportées dans {args.destination} ({octets} octets)")
+
+
+def importer(args):
+    """Convertit une sauvegarde compacte (ou JSON) vers le format donné par l'extension de destination"""
+    data = lire_sauvegarde(args.source)
+    contenu = encoder_sauvegarde(data, args.destination)
+    octets = ecrire_sauvegarde(args.destination, contenu)
+    print(f"✅ {len(data['memoire'])} questions importées dans {args.destination} ({octets} octets)")
+
+
+def chronometrer(fonction, octets, repetitions):
+    meilleur = float('inf')
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction(octets)
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return meilleur
+
+
+def comparer(args):
+    """Compare taille et temps de chargement du JSON et du format compact"""
+    data = lire_sauvegarde(args.fichier)
+    formats = {
+        'json (indent=2)': (json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'),
+                            lambda o: json.loads(o.decode('utf-8'))),
+        'compact': (encoder_compact(data, compresser=False), decoder_compact),
+        'compact + zlib': (encoder_compact(data), decoder_compact),
+    }
+
+    print(f"📚 {len(data['memoire'])} questions, "
+          f"{sum(len(r) for r in data['memoire'].values())} réponses ({args.fichier})")
+    print(f"{'format':<18}{'octets':>12}{'ratio':>8}{'chargement ms':>16}")
+    reference = len(formats['json (indent=2)'][0])
+    for nom, (octets, lire) in formats.items():
+        duree = chronometrer(lire, octets, args.repetitions)
+        print(f"{nom:<18}{len(octets):>12}{len(octets) / reference:>8.2f}{duree * 1000:>16.2f}")
+
+
+# =============================================
+# INTERROGATION ET ÉVALUATION
+# =============================================
+
+def charger_bot(args):
+    """Charge la base en lecture seule : rien n'est créé ni réécrit"""
+    if not os.path.exists(args.memoire):
+        raise SystemExit(f"❌ Base introuvable : {args.memoire}")
+    with redirect_stdout(sys.stderr):
+        bot = ChatBotDoubleMode(args.memoire, lecture_seule=True)
+    if args.mode:
+        bot.mode = args.mode
+    return bot
+
+
+def repondre(bot, question):
+    """Une ligne de résultat : réponse brute, type de correspondance et similarité"""
+    resultat = bot.trouver_reponse(question)
+    if resultat is None:
+        return {'question': question, 'type': None, 'reponse': None, 'correspondance': None, 'similarite': 0.0}
+    return {
+        'question': question,
+        'type': resultat['type'],
+        'reponse': bot.derniere_reponse,
+        'correspondance': resultat['question'],
+        'similarite': round(resultat['similarite'], 4)
+    }
+
+
+def interroger(args):
+    """Répond à une question par ligne (fichier ou entrée standard), une ligne JSON par réponse"""
+    bot = charger_bot(args)
+    entree = sys.stdin if args.fichier == '-' else open(args.fichier, 'r', encoding='utf-8')
+    interactif = entree.isatty()
+    with entree:
+        for ligne in entree:
+            question = ligne.strip()
+            if not question:
+                continue
+            sys.stdout.write(json.dumps(repondre(bot, question), ensure_ascii=False) + '\n')
+            if interactif:
+                sys.stdout.flush()
+
+
+def evaluer(args):
+    """Précision du chatbot sur un CSV étiqueté (colonnes question, reponse)"""
+    bot = charger_bot(args)
+    total = justes = 0
+    par_type = {}
+    erreurs = []
+    debut = time.perf_counter()
+
+    with open(args.fichier, 'r', encoding='utf-8') as f:
+        for ligne in csv.DictReader(f):
+            question = ligne.get('question', '').strip()
+            attendue = ligne.get('reponse', '').strip()
+            if not question:
+                continue
+            resultat = repondre(bot, question)
+            total += 1
+            par_type[resultat['type']] = par_type.get(resultat['type'], 0) + 1
+            if resultat['reponse'] is not None and resultat['reponse'].strip() == attendue:
+                justes += 1
+            elif len(erreurs) < args.erreurs:
+                erreurs.append((question, attendue, resultat['reponse']))
+
+    duree = time.perf_counter() - debut
+    print(f"🎯 Précision : {justes}/{total} ({100 * justes / max(total, 1):.2f} %)")
+    print(f"   exactes : {par_type.get('reponse', 0)}, variantes : {par_type.get('variante', 0)}, "
+          f"sans réponse : {par_type.get(None, 0)}")
+    print(f"⏱️  {total / max(duree, 1e-9):.0f} questions/s ({duree:.2f} s)")
+    for question, attendue, obtenue in erreurs:
+        print(f"   ❌ {question!r} : attendu {attendue!r}, obtenu {obtenue!r}")
+
+
+# =============================================
+# LANCEMENT
+# =============================================
+
+def ajouter_options_base(p):
+    p.add_argument('--memoire', default='mon_chatbot_double.json', help="base à charger (JSON ou .cbdb)")
+    p.add_argument('--mode', choices=['apprentissage', 'utilisation'],
+                   help="mode de sélection des réponses (par défaut : celui de la base)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outils du chatbot en ligne de commande")
+    commandes = parser.add_subparsers(dest='commande', required=True)
+
+    p = commandes.add_parser('exporter', help="sauvegarde -> format compact (.cbdb)")
+    p.add_argument('source')
+    p.add_argument('destination')
+    p.add_argument('--sans-compression', action='store_true')
+    p.set_defaults(fonction=exporter)
+
+    p = commandes.add_parser('importer', help="format compact -> sauvegarde (JSON, ou .cbdb)")
+    p.add_argument('source')
+    p.add_argument('destination')
+    p.set_defaults(fonction=importer)
+
+    p = commandes.add_parser('comparer', help="taille et temps de chargement JSON / compact")
+    p.add_argument('fichier')
+    p.add_argument('--repetitions', type=int, default=5)
+    p.set_defaults(fonction=comparer)
+
+    p = commandes.add_parser('interroger', help="répond aux questions d'un fichier (- : entrée standard)")
+    p.add_argument('fichier', nargs='?', default='-')
+    ajouter_options_base(p)
+    p.set_defaults(fonction=interroger)
+
+    p = commandes.add_parser('evaluer', help="précision sur un CSV étiqueté (question, reponse)")
+    p.add_argument('fichier')
+    ajouter_options_base(p)
+    p.add_argument('--erreurs', type=int, default=10, help="nombre d'erreurs à afficher")
+    p.set_defaults(fonction=evaluer)
+
+    args = parser.parse_args(argv)
+    args.fonction(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
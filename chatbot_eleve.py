@@ -3,44 +3,407 @@ CHATBOT DOUBLE MODE - Version fonctionnelle avec importation
 =============================================================
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, request, jsonify, g, Response, has_request_context
 import json
 import os
 import random
 import csv
 import unicodedata
 import re
-from datetime import datetime
+import shutil
+import threading
+import time
+import atexit
+import cProfile
+import gzip
+import hashlib
+import heapq
+import struct
+import sys
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from itertools import accumulate
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    # Pas de verrou de fichier sous Windows : un seul processus à la fois
+    fcntl = None
 
 # =============================================
 # CONFIGURATION
 # =============================================
 
-os.makedirs('templates', exist_ok=True)
-print("✅ Dossiers créés")
-
 app = Flask(__name__)
 app.secret_key = 'chatbot_double_mode_secret'
 
+# Profilage des requêtes lentes : '' (désactivé), '1' (toujours) ou 'entete'
+# (seulement si la requête porte l'en-tête X-Profilage: 1)
+PROFILAGE = os.environ.get('CHATBOT_PROFILAGE', '')
+PROFILAGE_SEUIL = float(os.environ.get('CHATBOT_PROFILAGE_SEUIL_MS', '500')) / 1000
+PROFILAGE_DOSSIER = os.environ.get('CHATBOT_PROFILAGE_DOSSIER', 'profils')
+
+# Au-delà de cette taille, le journal des changements est compacté dans la sauvegarde
+JOURNAL_TAILLE_MAX = 1024 * 1024
+# Nombre de changements gardés en mémoire pour /changements
+FLUX_CHANGEMENTS_MAX = 1000
+
+# Les votes 👍/👎 sont regroupés et appliqués toutes les N secondes (0 : un par un)
+FEEDBACK_INTERVALLE = float(os.environ.get('CHATBOT_FEEDBACK_INTERVALLE', '2'))
+
+# Modèle de score optionnel : demi-vie des scores (en jours) et nombre maximum
+# de réponses gardées par question (vide : désactivé)
+DEMI_VIE_JOURS = float(os.environ.get('CHATBOT_DEMI_VIE_JOURS') or 0) or None
+MAX_REPONSES = int(os.environ.get('CHATBOT_MAX_REPONSES') or 0) or None
+
+# Questions sans réponse : taille du cache négatif et nombre de questions suivies
+CACHE_NEGATIF_MAX = 10000
+QUESTIONS_INCONNUES_MAX = 1000
+
+# Compteurs partagés entre processus : leurs variations passent par le journal
+COMPTEURS_PARTAGES = ('feedbacks_positifs', 'feedbacks_negatifs', 'questions_sans_reponse')
+
+# Une base par classe (en-tête X-Classe ou paramètre ?classe=), chargée à la demande
+CLASSES_DOSSIER = os.environ.get('CHATBOT_CLASSES_DOSSIER', 'classes')
+CLASSES_MEMOIRE_MAX = int(os.environ.get('CHATBOT_CLASSES_MEMOIRE_MAX_MO', '256')) * 1024 * 1024
+# Estimation de la mémoire d'une base chargée : octets par question (index, mots,
+# listes), par réponse, plus le texte (mesuré avec tracemalloc, à ±25 % près)
+EMPREINTE_QUESTION = 1500
+EMPREINTE_REPONSE = 100
+CLASSE_VALIDE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+# =============================================
+# MÉTRIQUES (format texte Prometheus)
+# =============================================
+
+# Bornes des histogrammes de latence, en secondes
+BORNES_LATENCE = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Metriques:
+    """Compteurs et histogrammes en mémoire, exposés sur /metrics"""
+
+    def __init__(self, bornes=BORNES_LATENCE):
+        self.bornes = bornes
+        self.verrou = threading.Lock()
+        self.compteurs = {}
+        self.histogrammes = {}
+
+    def incrementer(self, nom, etiquettes=(), valeur=1):
+        """Ajoute une valeur à un compteur"""
+        cle = (nom, etiquettes)
+        with self.verrou:
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+
+    def observer(self, nom, duree, etiquettes=()):
+        """Enregistre une durée dans un histogramme"""
+        cle = (nom, etiquettes)
+        with self.verrou:
+            histo = self.histogrammes.get(cle)
+            if histo is None:
+                # [compte par borne..., +Inf, somme]
+                histo = self.histogrammes[cle] = [0] * (len(self.bornes) + 1) + [0.0]
+            for i, borne in enumerate(self.bornes):
+                if duree <= borne:
+                    histo[i] += 1
+                    break
+            else:
+                histo[len(self.bornes)] += 1
+            histo[-1] += duree
+
+    def cache(self, nom, touche):
+        """Compte un accès (succès ou échec) à un cache"""
+        self.incrementer('chatbot_cache_acces_total',
+                         (('cache', nom), ('resultat', 'succes' if touche else 'echec')))
+
+    @staticmethod
+    def _etiquettes(etiquettes, extra=()):
+        paires = tuple(etiquettes) + tuple(extra)
+        if not paires:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in paires) + '}'
+
+    def exporter(self, jauges=None):
+        """Produit le texte d'exposition Prometheus"""
+        with self.verrou:
+            compteurs = dict(self.compteurs)
+            histogrammes = {cle: list(h) for cle, h in self.histogrammes.items()}
+
+        lignes = []
+        for nom in sorted({n for n, _ in compteurs}):
+            lignes.append(f'# TYPE {nom} counter')
+            for (n, etiquettes), valeur in sorted(compteurs.items()):
+                if n == nom:
+                    lignes.append(f'{nom}{self._etiquettes(etiquettes)} {valeur}')
+
+        for nom in sorted({n for n, _ in histogrammes}):
+            lignes.append(f'# TYPE {nom} histogram')
+            for (n, etiquettes), histo in sorted(histogrammes.items()):
+                if n != nom:
+                    continue
+                cumul = 0
+                for i, borne in enumerate(self.bornes):
+                    cumul += histo[i]
+                    lignes.append(f'{nom}_bucket{self._etiquettes(etiquettes, (("le", borne),))} {cumul}')
+                cumul += histo[len(self.bornes)]
+                lignes.append(f'{nom}_bucket{self._etiquettes(etiquettes, (("le", "+Inf"),))} {cumul}')
+                lignes.append(f'{nom}_sum{self._etiquettes(etiquettes)} {histo[-1]}')
+                lignes.append(f'{nom}_count{self._etiquettes(etiquettes)} {cumul}')
+
+        for nom, valeur in (jauges or {}).items():
+            lignes.append(f'# TYPE {nom} gauge')
+            lignes.append(f'{nom} {valeur}')
+
+        return '\n'.join(lignes) + '\n'
+
+
+metriques = Metriques()
+
+
+# =============================================
+# SAUVEGARDES (JSON ou format compact)
+# =============================================
+
+# Format compact : en-tête (signature, version, drapeaux) puis des sections
+# préfixées par leur longueur : métadonnées JSON, table des textes (longueurs
+# en caractères + textes UTF-8 à la suite, chaque texte une seule fois), puis
+# des colonnes d'entiers (questions, nombre de réponses, réponses) et de scores.
+EXTENSION_COMPACTE = '.cbdb'
+# Première ligne de chaque sauvegarde : somme SHA-256 du reste du fichier
+ENTETE_SOMME = b'#CHATBOT-SHA256 '
+SIGNATURE_COMPACTE = b'CBDB'
+# Erreurs d'une sauvegarde abîmée (somme, UTF-8, JSON, format compact) ; les
+# autres erreurs d'accès au fichier (droits, trop de fichiers ouverts...) ne
+# disent rien de son contenu
+ERREURS_SAUVEGARDE_ILLISIBLE = (ValueError, struct.error, zlib.error, IndexError)
+FORMAT_COMPACT = 1
+COMPACT_ZLIB = 1
+
+
+def _colonne(code, valeurs):
+    colonne = array(code, valeurs)
+    if sys.byteorder == 'big':
+        colonne.byteswap()
+    return colonne.tobytes()
+
+
+def _lire_colonne(code, octets):
+    colonne = array(code)
+    colonne.frombytes(octets)
+    if sys.byteorder == 'big':
+        colonne.byteswap()
+    return colonne
+
+
+def encoder_compact(data, compresser=True):
+    """Encode une sauvegarde (même dictionnaire que le JSON) au format compact"""
+    memoire = data.get('memoire', {})
+    scores = data.get('scores', {})
+    horodatages = data.get('horodatages', {})
+
+    identifiants = {}
+    textes = []
+
+    def identifiant(texte):
+        i = identifiants.get(texte)
+        if i is None:
+            i = identifiants[texte] = len(textes)
+            textes.append(texte)
+        return i
+
+    questions, nb_reponses, reponses, tous_scores = [], [], [], []
+    for question, reponses_question in memoire.items():
+        questions.append(identifiant(question))
+        nb_reponses.append(len(reponses_question))
+        reponses.extend(identifiant(r) for r in reponses_question)
+        scores_question = list(scores.get(question, []))[:len(reponses_question)]
+        tous_scores.extend(scores_question + [1] * (len(reponses_question) - len(scores_question)))
+
+    code_scores = 'q' if all(isinstance(x, int) for x in tous_scores) else 'd'
+    meta = {cle: data[cle] for cle in ('mode', 'version', 'compteurs', 'derniere_maj') if cle in data}
+    sections = [
+        json.dumps(meta, ensure_ascii=False).encode('utf-8'),
+        _colonne('I', [len(t) for t in textes]),
+        ''.join(textes).encode('utf-8'),
+        _colonne('I', questions),
+        _colonne('I', nb_reponses),
+        _colonne('I', reponses),
+        code_scores.encode('ascii') + _colonne(code_scores, tous_scores),
+        # Horodatages (modèle à décroissance) : seulement les questions qui en ont
+        _colonne('I', [i for i, q in enumerate(memoire) if q in horodatages]),
+        _colonne('d', [horodatages[q] for q in memoire if q in horodatages]),
+    ]
+    corps = b''.join(struct.pack('<Q', len(section)) + section for section in sections)
+    drapeaux = 0
+    if compresser:
+        corps = zlib.compress(corps, 6)
+        drapeaux |= COMPACT_ZLIB
+    return struct.pack('<4sBB', SIGNATURE_COMPACTE, FORMAT_COMPACT, drapeaux) + corps
+
+
+def decoder_compact(octets):
+    """Décode une sauvegarde compacte en dictionnaire (même forme que le JSON)"""
+    signature, format_, drapeaux = struct.unpack_from('<4sBB', octets)
+    if signature != SIGNATURE_COMPACTE or format_ != FORMAT_COMPACT:
+        raise ValueError("Sauvegarde compacte inconnue")
+    corps = octets[struct.calcsize('<4sBB'):]
+    if drapeaux & COMPACT_ZLIB:
+        corps = zlib.decompress(corps)
+
+    sections = []
+    position = 0
+    while position < len(corps):
+        (taille,) = struct.unpack_from('<Q', corps, position)
+        position += 8
+        sections.append(corps[position:position + taille])
+        position += taille
+    meta, longueurs, blob, questions, nb_reponses, reponses, scores = sections[:7]
+    horodatages = sections[7:9]
+
+    # Un seul décodage UTF-8, puis découpage aux positions (en caractères)
+    tout = blob.decode('utf-8')
+    fins = list(accumulate(_lire_colonne('I', longueurs)))
+    textes = [tout[debut:fin] for debut, fin in zip([0] + fins, fins)]
+
+    reponses = [textes[r] for r in _lire_colonne('I', reponses)]
+    scores = _lire_colonne(scores[:1].decode('ascii'), scores[1:]).tolist()
+    questions = [textes[q] for q in _lire_colonne('I', questions)]
+    fins = list(accumulate(_lire_colonne('I', nb_reponses)))
+    debuts = [0] + fins
+
+    data = json.loads(meta)
+    data['memoire'] = {q: reponses[d:f] for q, d, f in zip(questions, debuts, fins)}
+    data['scores'] = {q: scores[d:f] for q, d, f in zip(questions, debuts, fins)}
+    indices, valeurs = _lire_colonne('I', horodatages[0]), _lire_colonne('d', horodatages[1])
+    data['horodatages'] = {questions[i]: h for i, h in zip(indices, valeurs)}
+    return data
+
+
+def lire_sauvegarde(chemin):
+    """Lit une sauvegarde JSON ou compacte (reconnue à sa signature)"""
+    with open(chemin, 'rb') as f:
+        octets = f.read()
+
+    if octets.startswith(ENTETE_SOMME):
+        entete, _, octets = octets.partition(b'\n')
+        attendue = entete[len(ENTETE_SOMME):].decode('ascii')
+        if hashlib.sha256(octets).hexdigest() != attendue:
+            raise ValueError("somme de contrôle invalide (sauvegarde tronquée ou corrompue)")
+
+    if octets.startswith(SIGNATURE_COMPACTE):
+        return decoder_compact(octets)
+    return json.loads(octets.decode('utf-8'))
+
+
+def ecrire_sauvegarde(chemin, contenu):
+    """Écrit une sauvegarde sans jamais laisser de fichier à moitié écrit.
+
+    Le contenu, précédé de sa somme SHA-256, va dans un fichier temporaire
+    synchronisé sur disque puis renommé à la place de l'ancien ; l'ancienne
+    version reste disponible en .bak.
+    """
+    entete = ENTETE_SOMME + hashlib.sha256(contenu).hexdigest().encode('ascii') + b'\n'
+    temporaire = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporaire, 'wb') as f:
+            f.write(entete)
+            f.write(contenu)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if os.path.exists(chemin):
+            # Lien vers la version actuelle : le fichier principal existe toujours
+            secours = chemin + '.bak'
+            secours_temporaire = temporaire + '.bak'
+            try:
+                os.link(chemin, secours_temporaire)
+            except OSError:
+                shutil.copyfile(chemin, secours_temporaire)
+            os.replace(secours_temporaire, secours)
+
+        os.replace(temporaire, chemin)
+    finally:
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+
+    if hasattr(os, 'O_DIRECTORY'):
+        dossier = os.open(os.path.dirname(os.path.abspath(chemin)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dossier)
+        finally:
+            os.close(dossier)
+    return len(entete) + len(contenu)
+
+
+def encoder_sauvegarde(data, chemin):
+    """Encode une sauvegarde selon l'extension du fichier (.cbdb : compact, sinon JSON)"""
+    if chemin.endswith(EXTENSION_COMPACTE):
+        return encoder_compact(data)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
 
 # =============================================
 # CLASSE CHATBOT
 # =============================================
 
 class ChatBotDoubleMode:
-    def __init__(self, fichier_memoire="mon_chatbot_double.json", tolerance=0.6):
+    def __init__(self, fichier_memoire="mon_chatbot_double.json", tolerance=0.6,
+                 demi_vie_jours=DEMI_VIE_JOURS, max_reponses=MAX_REPONSES, lecture_seule=False):
         self.fichier_memoire = fichier_memoire
+        # En lecture seule (outils hors ligne), rien n'est jamais écrit sur le disque
+        self.lecture_seule = lecture_seule
         self.memoire = {}
         self.scores = {}
+        self.demi_vie = demi_vie_jours * 86400 if demi_vie_jours else None
+        self.max_reponses = max_reponses
+        # Dernière mise à jour des scores de chaque question (pour la décroissance)
+        self.horodatages = {}
+        # Index de recherche : forme normalisée -> question, et question -> (forme normalisée, mots)
+        self.index_normalise = {}
+        self.formes_normalisees = {}
+        # Formes normalisées sans correspondance (vidé dès qu'une question est ajoutée)
+        # et questions inconnues les plus posées : forme -> [nombre, exemple]
+        self.cache_negatif = {}
+        self.questions_inconnues = {}
         self.mode = "apprentissage"
         self.derniere_question = ""
         self.derniere_reponse = ""
+        self.nb_candidats = 0
         self.tolerance = tolerance
 
+        # Compteurs tenus à jour à chaque modification (pas de parcours complet)
+        self.nb_reponses = 0
+        self.somme_scores = 0
+        self.nb_caracteres = 0
+        self.feedbacks_positifs = 0
+        self.feedbacks_negatifs = 0
+        self.questions_sans_reponse = 0
+
+        # Version de la base, partagée entre processus via le journal des changements
+        self.version = 0
+        self.fichier_journal = fichier_memoire + '.journal'
+        self.position_journal = 0
+        self.inode_journal = None
+        self.flux_changements = deque(maxlen=FLUX_CHANGEMENTS_MAX)
+        self.verrou = threading.RLock()
+
+        # Les sauvegardes sont copiées sous `verrou` mais écrites après l'avoir
+        # relâché ; le fichier .version garde l'ordre des écritures entre processus
+        self.verrou_sauvegarde = threading.Lock()
+        self.modifications_en_cours = 0
+        self.sauvegarde_differee = None
+
+        self.tampon_feedback = TamponFeedback(self, FEEDBACK_INTERVALLE)
+
         print("🤖 Initialisation ChatBot...")
         self.charger_memoire()
+        self.synchroniser()
 
-        if not self.memoire:
+        if not self.memoire and not self.lecture_seule:
             self.initialiser_base()
             print("✅ Base initialisée")
         else:
@@ -63,7 +426,10 @@ class ChatBotDoubleMode:
             "aide": [1, 1],
             "mode": [1]
         }
-        self.sauvegarder()
+        self._recalculer_compteurs()
+        self._reconstruire_index()
+        with self._modification():
+            self.sauvegarder()
 
     def importer_csv(self, fichier_csv):
         """Importe des questions-réponses depuis un fichier CSV"""
@@ -72,15 +438,17 @@ class ChatBotDoubleMode:
                 reader = csv.DictReader(f)
                 compteur = 0
 
-                for ligne in reader:
-                    question = ligne.get('question', '').strip()
-                    reponse = ligne.get('reponse', '').strip()
+                # Toutes les lignes sous le même verrou, une seule sauvegarde
+                with self._modification():
+                    for ligne in reader:
+                        question = ligne.get('question', '').strip()
+                        reponse = ligne.get('reponse', '').strip()
 
-                    if question and reponse:
-                        self.apprendre_reponse(question, reponse)
-                        compteur += 1
+                        if question and reponse:
+                            self._apprendre(question, reponse)
+                            compteur += 1
 
-            self.sauvegarder()
+                    self.sauvegarder()
             print(f"✅ Importé {compteur} questions-réponses depuis {fichier_csv}")
             return compteur
         except Exception as e:
@@ -103,9 +471,9 @@ class ChatBotDoubleMode:
         """Trouve des questions similaires"""
         variantes = []
 
-        for question_memoire in self.memoire.keys():
-            question_memoire_norm = self.normaliser_texte(question_memoire)
+        mots_question = set(question_normalisee.split())
 
+        for question_memoire, (question_memoire_norm, mots_memoire) in self.formes_normalisees.items():
             if question_normalisee == question_memoire_norm:
                 variantes.append((question_memoire, 1.0))
                 continue
@@ -114,9 +482,6 @@ class ChatBotDoubleMode:
                 variantes.append((question_memoire, 0.8))
                 continue
 
-            mots_question = set(question_normalisee.split())
-            mots_memoire = set(question_memoire_norm.split())
-
             if mots_question and mots_memoire:
                 intersection = mots_question.intersection(mots_memoire)
                 union = mots_question.union(mots_memoire)
@@ -130,34 +495,66 @@ class ChatBotDoubleMode:
         return variantes
 
     def trouver_reponse(self, question):
-        """Trouve la meilleure réponse"""
+        """Trouve la meilleure réponse.
+
+        Sous le verrou : le tampon de feedback (minuteur) et la relecture du
+        journal modifient l'index pendant que d'autres requêtes cherchent.
+        """
+        with self.verrou:
+            return self._trouver_reponse(question)
+
+    def _trouver_reponse(self, question):
+        debut = time.perf_counter()
         question_originale = question.strip()
         self.derniere_question = question_originale
 
         question_normalisee = self.normaliser_texte(question_originale)
+        t_normalisation = time.perf_counter()
+        metriques.observer('chatbot_etape_duree_secondes', t_normalisation - debut,
+                           (('etape', 'normalisation'),))
 
         # Recherche exacte
-        for question_memoire, reponses in self.memoire.items():
-            question_memoire_norm = self.normaliser_texte(question_memoire)
+        question_memoire = self.index_normalise.get(question_normalisee)
+        if question_memoire is not None:
+            reponses = self.memoire[question_memoire]
+            self.nb_candidats = 1
+            t_exacte = time.perf_counter()
+            metriques.observer('chatbot_etape_duree_secondes', t_exacte - t_normalisation,
+                               (('etape', 'recherche_exacte'),))
+            scores = self.scores.get(question_memoire, [])
 
-            if question_normalisee == question_memoire_norm:
-                scores = self.scores.get(question_memoire, [])
-
-                if self.mode == "utilisation":
-                    if scores:
-                        meilleur_score = max(scores)
-                        meilleures_indices = [i for i, s in enumerate(scores) if s == meilleur_score]
-                        idx = random.choice(meilleures_indices) if meilleures_indices else 0
-                    else:
-                        idx = 0
-                    self.derniere_reponse = reponses[idx] if reponses else ""
-                    return {'reponse': self.derniere_reponse, 'type': 'reponse'}
+            if self.mode == "utilisation":
+                if scores:
+                    meilleur_score = max(scores)
+                    meilleures_indices = [i for i, s in enumerate(scores) if s == meilleur_score]
+                    idx = random.choice(meilleures_indices) if meilleures_indices else 0
                 else:
-                    self.derniere_reponse = random.choice(reponses) if reponses else ""
-                    return {'reponse': self.derniere_reponse, 'type': 'reponse'}
+                    idx = 0
+                self.derniere_reponse = reponses[idx] if reponses else ""
+            else:
+                self.derniere_reponse = random.choice(reponses) if reponses else ""
+            metriques.observer('chatbot_etape_duree_secondes', time.perf_counter() - t_exacte,
+                               (('etape', 'selection'),))
+            return {'reponse': self.derniere_reponse, 'type': 'reponse',
+                    'question': question_memoire, 'similarite': 1.0}
+
+        t_exacte = time.perf_counter()
+        metriques.observer('chatbot_etape_duree_secondes', t_exacte - t_normalisation,
+                           (('etape', 'recherche_exacte'),))
+
+        # Question déjà cherchée sans succès depuis le dernier ajout de question
+        if question_normalisee in self.cache_negatif:
+            metriques.cache('negatif', True)
+            self.nb_candidats = 0
+            return self._sans_reponse(question_normalisee, question_originale)
+        metriques.cache('negatif', False)
 
         # Recherche de variantes
         variantes = self.trouver_variantes_proches(question_normalisee)
+        self.nb_candidats = len(variantes)
+        t_variantes = time.perf_counter()
+        metriques.observer('chatbot_etape_duree_secondes', t_variantes - t_exacte,
+                           (('etape', 'recherche_variantes'),))
 
         if variantes:
             meilleure_variante, similarite = variantes[0]
@@ -172,21 +569,53 @@ class ChatBotDoubleMode:
                 else:
                     idx = 0
                 self.derniere_reponse = reponses[idx] if reponses else ""
+                metriques.observer('chatbot_etape_duree_secondes', time.perf_counter() - t_variantes,
+                                   (('etape', 'selection'),))
 
                 if similarite >= 0.9:
-                    return {'reponse': self.derniere_reponse, 'type': 'reponse'}
+                    return {'reponse': self.derniere_reponse, 'type': 'reponse',
+                            'question': meilleure_variante, 'similarite': similarite}
                 else:
                     return {
                         'reponse': f"Je pense que vous voulez dire : '{meilleure_variante}'\n\n{self.derniere_reponse}",
-                        'type': 'variante'}
+                        'type': 'variante', 'question': meilleure_variante, 'similarite': similarite}
             else:
                 self.derniere_reponse = random.choice(reponses) if reponses else ""
+                metriques.observer('chatbot_etape_duree_secondes', time.perf_counter() - t_variantes,
+                                   (('etape', 'selection'),))
                 return {'reponse': f"Je pense que vous voulez dire : '{meilleure_variante}'\n\n{self.derniere_reponse}",
-                        'type': 'variante'}
+                        'type': 'variante', 'question': meilleure_variante, 'similarite': similarite}
 
+        if len(self.cache_negatif) >= CACHE_NEGATIF_MAX:
+            self.cache_negatif.pop(next(iter(self.cache_negatif), None), None)
+        self.cache_negatif[question_normalisee] = True
+        return self._sans_reponse(question_normalisee, question_originale)
+
+    def _sans_reponse(self, question_normalisee, question_originale):
+        """Compte une question restée sans réponse"""
         self.derniere_reponse = ""
+        self.tampon_feedback.noter_sans_reponse()
+
+        inconnue = self.questions_inconnues.get(question_normalisee)
+        if inconnue is not None:
+            inconnue[0] += 1
+        else:
+            self.questions_inconnues[question_normalisee] = [1, question_originale]
+            if len(self.questions_inconnues) > 2 * QUESTIONS_INCONNUES_MAX:
+                # On ne garde que les plus fréquentes (coût amorti sur QUESTIONS_INCONNUES_MAX ajouts)
+                gardees = heapq.nlargest(QUESTIONS_INCONNUES_MAX, self.questions_inconnues.items(),
+                                         key=lambda item: item[1][0])
+                self.questions_inconnues = dict(gardees)
         return None
 
+    def questions_frequentes_sans_reponse(self, limite=20):
+        """Questions inconnues les plus posées, pour les apprendre en priorité"""
+        with self.verrou:
+            plus_frequentes = heapq.nlargest(limite, self.questions_inconnues.items(),
+                                             key=lambda item: item[1][0])
+        return [{'question': exemple, 'forme': forme, 'nombre': nombre}
+                for forme, (nombre, exemple) in plus_frequentes]
+
     def donner_feedback(self, positif=True):
         """Donne un feedback"""
         if not self.derniere_question or not self.derniere_reponse:
@@ -194,83 +623,441 @@ class ChatBotDoubleMode:
 
         question = self.derniere_question.lower().strip()
 
+        with self._modification():
+            self._appliquer_votes(question, {self.derniere_reponse: (positif, None, 0)})
+            compteurs = {'feedbacks_positifs' if positif else 'feedbacks_negatifs': 1}
+            self._ajouter_compteurs(compteurs)
+            self._journaliser(question, compteurs)
+            self.sauvegarder()
+        return True
+
+    def enregistrer_feedback(self, positif=True):
+        """Met le feedback en attente, il sera appliqué avec le prochain lot"""
+        if not self.derniere_question or not self.derniere_reponse:
+            return False
+        if self.tampon_feedback.intervalle <= 0:
+            return self.donner_feedback(positif)
+
+        self.tampon_feedback.ajouter(self.derniere_question.lower().strip(), self.derniere_reponse, positif)
+        return True
+
+    def _appliquer_votes(self, question, votes):
+        """Applique des votes regroupés par réponse sur une question.
+
+        `votes` associe chaque réponse à (premier_positif, plancher, decalage) :
+        le premier vote compte comme un vote isolé, les suivants se résument à
+        s -> max(plancher, s + decalage), ce qui donne le même score que les
+        appliquer un par un avec max(0, ...).
+        """
         if question not in self.memoire:
-            self.memoire[question] = [self.derniere_reponse]
-            self.scores[question] = [2 if positif else 0]
-        else:
-            if self.derniere_reponse in self.memoire[question]:
-                idx = self.memoire[question].index(self.derniere_reponse)
-                if positif:
-                    self.scores[question][idx] += 1
-                else:
-                    self.scores[question][idx] = max(0, self.scores[question][idx] - 1)
+            self._creer_question(question)
+        self._vieillir(question)
+
+        positions = {}
+        for i, reponse in enumerate(self.memoire[question]):
+            positions.setdefault(reponse, i)
+
+        for reponse, (premier_positif, plancher, decalage) in votes.items():
+            idx = positions.get(reponse)
+            if idx is None:
+                self._ajouter_reponse(question, reponse, 2 if premier_positif else 0)
+                idx = positions[reponse] = len(self.memoire[question]) - 1
+                score = self.scores[question][idx]
+            elif premier_positif:
+                score = self.scores[question][idx] + 1
             else:
-                self.memoire[question].append(self.derniere_reponse)
-                self.scores[question].append(2 if positif else 0)
+                score = max(0, self.scores[question][idx] - 1)
 
-        self.sauvegarder()
-        return True
+            score += decalage
+            if plancher is not None:
+                score = max(plancher, score)
+            self._modifier_score(question, idx, score)
+
+        self._elaguer(question)
 
     def apprendre_reponse(self, question, reponse):
         """Apprend une nouvelle réponse"""
-        question_lower = question.lower().strip()
+        with self._modification():
+            if not self._apprendre(question, reponse):
+                return False
+            self.sauvegarder()
+        return True
 
+    def _apprendre(self, question, reponse):
+        """Ajoute et journalise une réponse, sans sauvegarder (dans un bloc `_modification()`)"""
+        question_lower = question.lower().strip()
         if question_lower not in self.memoire:
-            self.memoire[question_lower] = []
-            self.scores[question_lower] = []
+            self._creer_question(question_lower)
 
-        if reponse not in self.memoire[question_lower]:
-            self.memoire[question_lower].append(reponse)
-            self.scores[question_lower].append(1)
-            self.sauvegarder()
-            return True
+        if reponse in self.memoire[question_lower]:
+            return False
 
-        return False
+        self._vieillir(question_lower)
+        self._ajouter_reponse(question_lower, reponse, 1)
+        self._elaguer(question_lower, garder=reponse)
+        self._journaliser(question_lower)
+        return True
+
+    def _creer_question(self, question):
+        """Ajoute une question sans réponse et l'indexe"""
+        self.memoire[question] = []
+        self.scores[question] = []
+        self.nb_caracteres += len(question)
+        self._indexer(question)
+
+    def _indexer(self, question):
+        forme = self.normaliser_texte(question)
+        # Comme l'ancien parcours de la mémoire : la première question arrivée l'emporte
+        self.index_normalise.setdefault(forme, question)
+        self.formes_normalisees[question] = (forme, set(forme.split()))
+        # Une nouvelle question peut répondre aux questions jusque-là inconnues
+        self.cache_negatif = {}
+        self.questions_inconnues.pop(forme, None)
+
+    def _reconstruire_index(self):
+        """Réindexe toute la mémoire (au chargement seulement)"""
+        self.index_normalise = {}
+        self.formes_normalisees = {}
+        for question in self.memoire:
+            self._indexer(question)
+
+    def _ajouter_reponse(self, question, reponse, score):
+        """Ajoute une réponse à une question existante et met à jour les compteurs"""
+        self.memoire[question].append(reponse)
+        self.scores[question].append(score)
+        self.nb_reponses += 1
+        self.somme_scores += score
+        self.nb_caracteres += len(reponse)
+
+    def _modifier_score(self, question, idx, score):
+        """Change un score et met à jour les compteurs"""
+        self.somme_scores += score - self.scores[question][idx]
+        self.scores[question][idx] = score
+
+    def _ajouter_compteurs(self, compteurs):
+        """Applique des variations de compteurs partagés (votes, questions sans réponse)"""
+        for nom, delta in compteurs.items():
+            if nom in COMPTEURS_PARTAGES:
+                setattr(self, nom, getattr(self, nom) + delta)
+
+    def _recalculer_compteurs(self):
+        """Recalcule les compteurs dérivés de la mémoire (au chargement seulement)"""
+        self.nb_reponses = sum(len(r) for r in self.memoire.values())
+        self.somme_scores = sum(sum(s) for s in self.scores.values())
+        self.nb_caracteres = sum(len(q) + sum(map(len, r)) for q, r in self.memoire.items())
+
+    def _remplacer_question(self, question, reponses, scores, horodatage=None):
+        """Remplace toutes les réponses d'une question (changement venu du journal)"""
+        if question not in self.memoire:
+            self._creer_question(question)
+        self.nb_reponses += len(reponses) - len(self.memoire[question])
+        self.somme_scores += sum(scores) - sum(self.scores[question])
+        self.nb_caracteres += sum(map(len, reponses)) - sum(map(len, self.memoire[question]))
+        self.memoire[question] = reponses
+        self.scores[question] = scores
+        if horodatage is not None:
+            self.horodatages[question] = horodatage
+
+    def _vieillir(self, question):
+        """Applique la décroissance exponentielle aux scores d'une question avant de la modifier"""
+        if not self.demi_vie:
+            return
+        maintenant = time.time()
+        precedent = self.horodatages.get(question)
+        self.horodatages[question] = maintenant
+        if precedent is None or maintenant <= precedent:
+            return
+
+        facteur = 0.5 ** ((maintenant - precedent) / self.demi_vie)
+        scores = self.scores[question]
+        for idx, score in enumerate(scores):
+            self._modifier_score(question, idx, round(score * facteur, 4))
+
+    def _elaguer(self, question, garder=None):
+        """Ne garde que les max_reponses meilleures réponses d'une question (et `garder`)"""
+        reponses = self.memoire[question]
+        if not self.max_reponses or len(reponses) <= self.max_reponses:
+            return
+
+        scores = self.scores[question]
+        ordre = sorted(range(len(reponses)), key=lambda i: (reponses[i] != garder, -scores[i], i))
+        gardees = sorted(ordre[:self.max_reponses])
+        retirees = len(reponses) - len(gardees)
+
+        self.nb_reponses -= retirees
+        self.somme_scores -= sum(scores) - sum(scores[i] for i in gardees)
+        self.nb_caracteres -= sum(map(len, reponses)) - sum(len(reponses[i]) for i in gardees)
+        self.memoire[question] = [reponses[i] for i in gardees]
+        self.scores[question] = [scores[i] for i in gardees]
+        metriques.incrementer('chatbot_reponses_elaguees_total', valeur=retirees)
+
+    # ---------------------------------------------
+    # Journal des changements (plusieurs processus)
+    # ---------------------------------------------
+
+    def _lire_journal(self):
+        """Applique les entrées du journal écrites depuis la dernière lecture"""
+        try:
+            etat = os.stat(self.fichier_journal)
+        except FileNotFoundError:
+            return
+        if etat.st_ino != self.inode_journal or etat.st_size < self.position_journal:
+            if self.inode_journal is not None:
+                # Journal compacté par un autre processus : on repart de la sauvegarde
+                self.charger_memoire()
+            self.inode_journal = etat.st_ino
+            self.position_journal = 0
+        if etat.st_size == self.position_journal:
+            return
+
+        with open(self.fichier_journal, 'rb') as f:
+            f.seek(self.position_journal)
+            for ligne in f:
+                if not ligne.endswith(b'\n'):
+                    break  # écriture en cours dans un autre processus
+                self.position_journal += len(ligne)
+                entree = json.loads(ligne)
+                if entree['v'] <= self.version:
+                    continue
+                if 'q' in entree:
+                    self._remplacer_question(entree['q'], entree['r'], entree['s'], entree.get('t'))
+                if 'c' in entree:
+                    self._ajouter_compteurs(entree['c'])
+                self.version = entree['v']
+                self.flux_changements.append((entree['v'], entree.get('q')))
+
+    def synchroniser(self):
+        """Applique les changements faits par les autres processus (un stat si rien de neuf)"""
+        # Sans verrou : la plupart des requêtes n'ont rien à relire
+        try:
+            etat = os.stat(self.fichier_journal)
+        except OSError:
+            return
+        if etat.st_ino == self.inode_journal and etat.st_size == self.position_journal:
+            return
+
+        with self.verrou:
+            try:
+                self._lire_journal()
+            except (OSError, ValueError, KeyError) as e:
+                print(f"❌ Erreur de lecture du journal: {e}")
+
+    @contextmanager
+    def _modification(self):
+        """Verrouille la base pour une modification, dans ce processus et entre processus.
+
+        Le journal est relu sous le verrou de fichier, puis la modification est
+        faite et journalisée avant de le relâcher : aucun autre processus ne
+        peut écrire une entrée entre la relecture et la nôtre. Une sauvegarde
+        demandée dans le bloc n'est écrite qu'une fois les verrous relâchés.
+        """
+        with self.verrou:
+            verrou = None
+            if not self.lecture_seule:
+                try:
+                    verrou = open(self.fichier_journal + '.verrou', 'a')
+                except OSError as e:
+                    print(f"❌ Erreur de verrouillage du journal: {e}")
+            self.modifications_en_cours += 1
+            try:
+                if verrou is not None and fcntl is not None:
+                    fcntl.flock(verrou, fcntl.LOCK_EX)
+                self.synchroniser()
+                yield
+            finally:
+                self.modifications_en_cours -= 1
+                if verrou is not None:
+                    verrou.close()
+                instantane = None
+                if not self.modifications_en_cours:
+                    instantane, self.sauvegarde_differee = self.sauvegarde_differee, None
+        if instantane is not None:
+            self._ecrire_instantane(instantane)
+
+    def _journaliser(self, question, compteurs=None):
+        """Ajoute l'état d'une question modifiée (et/ou des variations de compteurs,
+        déjà appliquées ici) au journal et passe à la version suivante.
+
+        À appeler dans un bloc `_modification()`.
+        """
+        if self.lecture_seule:
+            return
+        try:
+            self.version += 1
+            entree = {'v': self.version}
+            if question is not None:
+                entree.update(q=question, r=self.memoire[question], s=self.scores[question])
+                if question in self.horodatages:
+                    entree['t'] = self.horodatages[question]
+            if compteurs:
+                entree['c'] = compteurs
+            with open(self.fichier_journal, 'ab') as f:
+                f.write(json.dumps(entree, ensure_ascii=False).encode('utf-8') + b'\n')
+                self.position_journal = f.tell()
+                self.inode_journal = os.fstat(f.fileno()).st_ino
+            self.flux_changements.append((self.version, question))
+
+            if self.position_journal > JOURNAL_TAILLE_MAX and self._ecrire_instantane(self._instantane()):
+                # La sauvegarde contient tout : on repart d'un journal vide
+                # (nouveau fichier, pour que les autres processus le détectent)
+                temporaire = self.fichier_journal + '.tmp'
+                open(temporaire, 'wb').close()
+                os.replace(temporaire, self.fichier_journal)
+                self.inode_journal = os.stat(self.fichier_journal).st_ino
+                self.position_journal = 0
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Erreur d'écriture du journal: {e}")
+
+    def changements_depuis(self, version):
+        """Questions modifiées après `version`, ou None si le flux ne remonte pas si loin"""
+        self.synchroniser()
+        with self.verrou:
+            if version >= self.version:
+                return []
+            if not self.flux_changements or self.flux_changements[0][0] > version + 1:
+                return None
+            questions = []
+            for v, question in self.flux_changements:
+                if v > version and question is not None and question not in questions:
+                    questions.append(question)
+            return questions
 
     def changer_mode(self, nouveau_mode):
         """Change de mode"""
         if nouveau_mode in ["apprentissage", "utilisation"]:
-            self.mode = nouveau_mode
-            self.sauvegarder()
+            with self._modification():
+                self.mode = nouveau_mode
+                self.sauvegarder()
             return True
         return False
 
     def charger_memoire(self):
-        """Charge la mémoire"""
-        try:
-            if os.path.exists(self.fichier_memoire):
-                with open(self.fichier_memoire, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.memoire = data.get('memoire', {})
-                    self.scores = data.get('scores', {})
-                    self.mode = data.get('mode', 'apprentissage')
-        except:
-            self.memoire = {}
-            self.scores = {}
+        """Charge la mémoire (ou la sauvegarde précédente si elle est abîmée).
+
+        Une erreur d'accès au fichier (OSError) remonte telle quelle : la
+        sauvegarde n'est mise de côté que si son contenu est illisible.
+        """
+        data = None
+        for chemin in (self.fichier_memoire, self.fichier_memoire + '.bak'):
+            if not os.path.exists(chemin):
+                continue
+            try:
+                data = lire_sauvegarde(chemin)
+                break
+            except ERREURS_SAUVEGARDE_ILLISIBLE as e:
+                print(f"⚠️ Sauvegarde illisible {chemin}: {e}")
+                metriques.incrementer('chatbot_sauvegardes_illisibles_total')
+                if chemin == self.fichier_memoire and not self.lecture_seule:
+                    # Mis de côté : la prochaine sauvegarde écraserait sinon le .bak avec
+                    try:
+                        os.replace(chemin, chemin + '.corrompu')
+                    except OSError as erreur:
+                        print(f"❌ Impossible de mettre de côté {chemin}: {erreur}")
+
+        self.memoire = {}
+        self.scores = {}
+        if data is not None:
+            self.memoire = data.get('memoire', {})
+            self.scores = data.get('scores', {})
+            self.mode = data.get('mode', 'apprentissage')
+            compteurs = data.get('compteurs', {})
+            self.feedbacks_positifs = compteurs.get('feedbacks_positifs', 0)
+            self.feedbacks_negatifs = compteurs.get('feedbacks_negatifs', 0)
+            self.questions_sans_reponse = compteurs.get('questions_sans_reponse', 0)
+            self.version = data.get('version', 0)
+            self.horodatages = data.get('horodatages', {})
+        if self.max_reponses:
+            for question in self.memoire:
+                self._elaguer(question)
+        self._recalculer_compteurs()
+        self._reconstruire_index()
+        self.position_journal = 0
+        self.flux_changements.clear()
 
     def sauvegarder(self):
-        """Sauvegarde la mémoire"""
-        try:
-            data = {
-                'memoire': self.memoire,
-                'scores': self.scores,
+        """Sauvegarde la mémoire.
+
+        Dans un bloc `_modification()`, l'état est copié tout de suite et écrit
+        à la sortie du bloc, pour ne pas garder les verrous pendant l'écriture.
+        """
+        if self.lecture_seule:
+            return False
+        with self.verrou:
+            instantane = self._instantane()
+            if self.modifications_en_cours:
+                self.sauvegarde_differee = instantane
+                return True
+        return self._ecrire_instantane(instantane)
+
+    def _instantane(self):
+        """Copie de l'état à sauvegarder (sous le verrou ; l'encodage se fait après)"""
+        with self.verrou:
+            return self.version, {
+                'memoire': {q: list(r) for q, r in self.memoire.items()},
+                'scores': {q: list(s) for q, s in self.scores.items()},
                 'mode': self.mode,
+                'version': self.version,
+                'horodatages': dict(self.horodatages),
+                'compteurs': {
+                    'feedbacks_positifs': self.feedbacks_positifs,
+                    'feedbacks_negatifs': self.feedbacks_negatifs,
+                    'questions_sans_reponse': self.questions_sans_reponse
+                },
                 'derniere_maj': datetime.now().isoformat()
             }
-            with open(self.fichier_memoire, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def _ecrire_instantane(self, instantane):
+        """Encode et écrit une copie de l'état, sauf si une version plus récente est déjà sur disque.
+
+        Le fichier .version (verrouillé pendant l'écriture) note la version et
+        l'inode de la dernière sauvegarde : un instantané en retard, venant de
+        ce processus ou d'un autre, ne remplace jamais un plus récent.
+        """
+        version, data = instantane
+        debut = time.perf_counter()
+        try:
+            with self.verrou_sauvegarde, open(self.fichier_memoire + '.version', 'a+') as suivi:
+                if fcntl is not None:
+                    fcntl.flock(suivi, fcntl.LOCK_EX)
+                suivi.seek(0)
+                derniere = suivi.read().split()
+                if len(derniere) == 2 and version < int(derniere[0]):
+                    try:
+                        if os.stat(self.fichier_memoire).st_ino == int(derniere[1]):
+                            return True
+                    except FileNotFoundError:
+                        pass
+
+                contenu = encoder_sauvegarde(data, self.fichier_memoire)
+                octets = ecrire_sauvegarde(self.fichier_memoire, contenu)
+                suivi.seek(0)
+                suivi.truncate()
+                suivi.write(f"{version} {os.stat(self.fichier_memoire).st_ino}")
+                suivi.flush()
+            metriques.observer('chatbot_sauvegarde_duree_secondes', time.perf_counter() - debut)
+            metriques.incrementer('chatbot_sauvegarde_octets_total', valeur=octets)
+            metriques.incrementer('chatbot_sauvegardes_total')
             return True
-        except:
+        except Exception as e:
+            print(f"❌ Erreur lors de la sauvegarde: {e}")
+            metriques.incrementer('chatbot_sauvegardes_echouees_total')
             return False
 
+    def empreinte_memoire(self):
+        """Mémoire occupée par la base chargée, estimée à partir des compteurs (octets)"""
+        return (len(self.memoire) * EMPREINTE_QUESTION + self.nb_reponses * EMPREINTE_REPONSE
+                + self.nb_caracteres)
+
     def get_statistiques(self):
         """Retourne les statistiques"""
-        total_questions = len(self.memoire)
-        total_reponses = sum(len(r) for r in self.memoire.values())
         return {
-            'questions': total_questions,
-            'reponses': total_reponses,
-            'mode': self.mode
+            'questions': len(self.memoire),
+            'reponses': self.nb_reponses,
+            'mode': self.mode,
+            'feedbacks_positifs': self.feedbacks_positifs,
+            'feedbacks_negatifs': self.feedbacks_negatifs,
+            'questions_sans_reponse': self.questions_sans_reponse,
+            'score_moyen': round(self.somme_scores / self.nb_reponses, 2) if self.nb_reponses else 0
         }
 
 
@@ -278,7 +1065,203 @@ class ChatBotDoubleMode:
 # INITIALISATION
 # =============================================
 
-bot = ChatBotDoubleMode()
+class TamponFeedback:
+    """Regroupe les votes et les questions sans réponse d'un chatbot et les applique par lots (une sauvegarde par lot)"""
+
+    def __init__(self, chatbot, intervalle):
+        self.chatbot = chatbot
+        self.intervalle = intervalle
+        self.verrou = threading.Lock()
+        self.votes = {}
+        self.positifs = 0
+        self.negatifs = 0
+        self.sans_reponse = 0
+        self.minuteur = None
+
+    def ajouter(self, question, reponse, positif):
+        """Ajoute un vote au lot en cours"""
+        with self.verrou:
+            votes_question = self.votes.setdefault(question, {})
+            vote = votes_question.get(reponse)
+            if vote is None:
+                votes_question[reponse] = (positif, None, 0)
+            else:
+                # Composition avec s -> max(0, s ± 1)
+                premier_positif, plancher, decalage = vote
+                delta = 1 if positif else -1
+                plancher = 0 if plancher is None else max(0, plancher + delta)
+                votes_question[reponse] = (premier_positif, plancher, decalage + delta)
+
+            if positif:
+                self.positifs += 1
+            else:
+                self.negatifs += 1
+            self._armer()
+
+    def noter_sans_reponse(self):
+        """Compte une question sans réponse (journalisée avec le prochain lot)"""
+        if self.intervalle <= 0:
+            chatbot = self.chatbot
+            with chatbot._modification():
+                chatbot._ajouter_compteurs({'questions_sans_reponse': 1})
+                chatbot._journaliser(None, {'questions_sans_reponse': 1})
+            return
+        with self.verrou:
+            self.sans_reponse += 1
+            self._armer()
+
+    def _armer(self):
+        """Démarre le minuteur du lot en cours (sous le verrou)"""
+        if self.minuteur is None:
+            self.minuteur = threading.Timer(self.intervalle, self.vider)
+            self.minuteur.daemon = True
+            self.minuteur.start()
+
+    def vider(self):
+        """Applique tous les votes en attente et sauvegarde une seule fois"""
+        with self.verrou:
+            votes, self.votes = self.votes, {}
+            positifs, negatifs, sans_reponse = self.positifs, self.negatifs, self.sans_reponse
+            self.positifs = self.negatifs = self.sans_reponse = 0
+            if self.minuteur is not None:
+                self.minuteur.cancel()
+                self.minuteur = None
+        if not votes and not sans_reponse:
+            return 0
+
+        debut = time.perf_counter()
+        chatbot = self.chatbot
+        # La vraie écriture des votes se fait ici (souvent sur le minuteur) : on la profile aussi
+        with profiler_requete('feedback_lot', f"{len(votes)} questions", chatbot), chatbot._modification():
+            for question, votes_question in votes.items():
+                chatbot._appliquer_votes(question, votes_question)
+                chatbot._journaliser(question)
+            compteurs = {'feedbacks_positifs': positifs, 'feedbacks_negatifs': negatifs,
+                         'questions_sans_reponse': sans_reponse}
+            compteurs = {nom: delta for nom, delta in compteurs.items() if delta}
+            chatbot._ajouter_compteurs(compteurs)
+            chatbot._journaliser(None, compteurs)
+            if votes:
+                chatbot.sauvegarder()
+
+        metriques.observer('chatbot_feedback_lot_duree_secondes', time.perf_counter() - debut)
+        metriques.incrementer('chatbot_feedback_lots_total')
+        metriques.incrementer('chatbot_feedback_votes_total', valeur=positifs + negatifs)
+        return positifs + negatifs
+
+
+class GestionnaireClasses:
+    """Une base par classe, chargée au premier accès et évincée (LRU) au-delà du budget mémoire"""
+
+    def __init__(self, bot_defaut, dossier=CLASSES_DOSSIER, budget=CLASSES_MEMOIRE_MAX):
+        self.bot_defaut = bot_defaut
+        self.dossier = dossier
+        self.budget = budget
+        self.classes = OrderedDict()
+        self.chargements = {}
+        self.verrou = threading.Lock()
+
+    def obtenir(self, classe, creer=True):
+        """Retourne le chatbot de la classe (la base par défaut si aucune classe).
+
+        Une classe absente est chargée hors du verrou global, sous un verrou
+        propre à la classe : les autres classes restent servies pendant ce temps.
+        Avec `creer=False` (routes en lecture), une classe qui n'a pas encore
+        de fichier n'en crée pas : on répond avec une base vide en lecture seule.
+        """
+        if not classe:
+            return self.bot_defaut
+        if not CLASSE_VALIDE.match(classe):
+            raise ValueError(f"Classe invalide: {classe}")
+
+        chemin = os.path.join(self.dossier, f"{classe}.json")
+        existe = creer or os.path.exists(chemin)
+        with self.verrou:
+            chatbot = self._trouver(classe)
+            if chatbot is not None:
+                return chatbot
+            if not existe and classe not in self.chargements:
+                chargement = None
+            else:
+                chargement = self.chargements.setdefault(classe, threading.Lock())
+
+        if chargement is None:
+            return ChatBotDoubleMode(chemin, self.bot_defaut.tolerance, lecture_seule=True)
+
+        with chargement:
+            with self.verrou:
+                # Chargée par une autre requête pendant qu'on attendait
+                chatbot = self._trouver(classe)
+            if chatbot is not None:
+                return chatbot
+
+            metriques.cache('classes', False)
+            os.makedirs(self.dossier, exist_ok=True)
+            chatbot = ChatBotDoubleMode(chemin, self.bot_defaut.tolerance)
+            with self.verrou:
+                self.classes[classe] = chatbot
+                del self.chargements[classe]
+                evincees = self._evincer()
+
+        for classe_evincee, chatbot_evince in evincees:
+            # Tout est déjà sauvegardé sauf les votes en attente
+            chatbot_evince.tampon_feedback.vider()
+            metriques.incrementer('chatbot_classes_evincees_total')
+            print(f"📤 Classe {classe_evincee} déchargée")
+        return chatbot
+
+    def _trouver(self, classe):
+        """Classe déjà chargée (sous le verrou global), ou None"""
+        chatbot = self.classes.get(classe)
+        if chatbot is not None:
+            self.classes.move_to_end(classe)
+            metriques.cache('classes', True)
+        return chatbot
+
+    def chargees(self):
+        """Copie des bases chargées, à parcourir sans tenir le verrou"""
+        with self.verrou:
+            return list(self.classes.values())
+
+    def taille_totale(self):
+        return sum(c.empreinte_memoire() for c in self.chargees())
+
+    def _evincer(self):
+        """Retire les classes les moins récemment utilisées jusqu'à repasser sous le budget (sous le verrou)"""
+        taille = sum(c.empreinte_memoire() for c in self.classes.values())
+        evincees = []
+        while taille > self.budget and len(self.classes) > 1:
+            classe, chatbot = self.classes.popitem(last=False)
+            taille -= chatbot.empreinte_memoire()
+            evincees.append((classe, chatbot))
+        return evincees
+
+
+# Créés au premier besoin et pas à l'import : les outils en ligne de commande
+# importent ce module sans vouloir de base dans le dossier courant
+bot = None
+classes = None
+verrou_initialisation = threading.Lock()
+
+
+def initialiser_application():
+    """Charge la base par défaut et le gestionnaire de classes (une seule fois)"""
+    global bot, classes
+    if classes is None:
+        with verrou_initialisation:
+            if classes is None:
+                bot = ChatBotDoubleMode()
+                classes = GestionnaireClasses(bot)
+                atexit.register(vider_tampons)
+    return bot
+
+
+def vider_tampons():
+    """Applique les votes en attente de toutes les bases chargées"""
+    if classes is None:
+        return
+    for chatbot in [bot, *classes.chargees()]:
+        chatbot.tampon_feedback.vider()
 
 # =============================================
 # HTML COMPLET AVEC IMPORTATION ET POP-UP AUTOMATIQUE
@@ -425,10 +1408,16 @@ HTML_INTERFACE = '''<!DOCTYPE html>
         // Variables globales
         var modeActuel = 'apprentissage';
         var questionEnCours = '';
+        var classe = new URLSearchParams(window.location.search).get('classe');
+
+        // Ajoute la classe (?classe=...) aux appels au serveur
+        function url(route) {
+            return classe ? route + '?classe=' + encodeURIComponent(classe) : route;
+        }
 
         // Fonction pour charger le mode
         function chargerMode() {
-            fetch('/get_mode')
+            fetch(url('/get_mode'))
                 .then(function(response) {
                     return response.json();
                 })
@@ -467,7 +1456,7 @@ HTML_INTERFACE = '''<!DOCTYPE html>
         function changerMode(nouveauMode) {
             if (nouveauMode === modeActuel) return;
 
-            fetch('/changer_mode', {
+            fetch(url('/changer_mode'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -504,7 +1493,7 @@ HTML_INTERFACE = '''<!DOCTYPE html>
             ajouterMessage(message, 'user');
             input.value = '';
 
-            fetch('/chat', {
+            fetch(url('/chat'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -596,7 +1585,7 @@ HTML_INTERFACE = '''<!DOCTYPE html>
 
         // Donner un feedback
         function donnerFeedback(question, reponse, positif) {
-            fetch('/feedback', {
+            fetch(url('/feedback'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -647,7 +1636,7 @@ HTML_INTERFACE = '''<!DOCTYPE html>
                 return;
             }
 
-            fetch('/apprendre', {
+            fetch(url('/apprendre'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -692,7 +1681,7 @@ HTML_INTERFACE = '''<!DOCTYPE html>
             document.getElementById('importMessage').textContent = 'Importation en cours...';
             document.getElementById('importMessage').style.color = '#4caf50';
 
-            fetch('/importer_base', {
+            fetch(url('/importer_base'), {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -725,7 +1714,7 @@ HTML_INTERFACE = '''<!DOCTYPE html>
 
         // Statistiques
         function chargerStatistiques() {
-            fetch('/statistiques')
+            fetch(url('/statistiques'))
                 .then(function(response) {
                     return response.json();
                 })
@@ -801,19 +1790,133 @@ HTML_INTERFACE = '''<!DOCTYPE html>
 </body>
 </html>'''
 
+# Interface précompressée une fois pour toutes (servie telle quelle par index())
+HTML_OCTETS = HTML_INTERFACE.encode('utf-8')
+HTML_VARIANTES = {
+    'identity': HTML_OCTETS,
+    'gzip': gzip.compress(HTML_OCTETS, compresslevel=9),
+}
+try:
+    import brotli
+    HTML_VARIANTES['br'] = brotli.compress(HTML_OCTETS)
+except ImportError:
+    pass
+HTML_ETAG = hashlib.sha1(HTML_OCTETS).hexdigest()[:16]
+HTML_DATE = datetime.fromtimestamp(int(os.path.getmtime(__file__)), timezone.utc)
+
 
 # =============================================
 # ROUTES FLASK AVEC IMPORTATION
 # =============================================
 
+def profilage_actif():
+    """Indique si la requête courante doit être profilée (hors requête, seulement avec CHATBOT_PROFILAGE=1)"""
+    if PROFILAGE == '1':
+        return True
+    if PROFILAGE == 'entete' and has_request_context():
+        return request.headers.get('X-Profilage') == '1'
+    return False
+
+
+@contextmanager
+def profiler_requete(nom, question='', chatbot=None):
+    """Profile le bloc et garde le profil si la durée dépasse le seuil.
+
+    `chatbot` sert au contexte du profil ; par défaut celui de la requête.
+    """
+    profil = None
+    if profilage_actif():
+        profil = cProfile.Profile()
+        try:
+            profil.enable()
+        except ValueError:
+            # Un autre profileur est déjà actif dans ce processus
+            profil = None
+
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profil is not None:
+            profil.disable()
+            duree = time.perf_counter() - debut
+            if duree >= PROFILAGE_SEUIL:
+                enregistrer_profil(profil, nom, question, duree, chatbot or g.bot)
+
+
+def enregistrer_profil(profil, nom, question, duree, chatbot):
+    """Écrit le profil cProfile et son contexte dans PROFILAGE_DOSSIER"""
+    try:
+        os.makedirs(PROFILAGE_DOSSIER, exist_ok=True)
+        base = os.path.join(PROFILAGE_DOSSIER, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{nom}")
+        profil.dump_stats(base + '.prof')
+        stats = chatbot.get_statistiques()
+        contexte = {
+            'route': nom,
+            'question': question,
+            'duree_ms': round(duree * 1000, 3),
+            'nb_candidats': chatbot.nb_candidats,
+            'questions': stats['questions'],
+            'reponses': stats['reponses'],
+        }
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(contexte, f, ensure_ascii=False, indent=2)
+        print(f"🐢 Requête lente profilée ({contexte['duree_ms']} ms) : {base}.prof")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'enregistrement du profil: {e}")
+
+
+@app.before_request
+def demarrer_chrono():
+    g.debut_requete = time.perf_counter()
+    g.classe = request.headers.get('X-Classe') or request.args.get('classe', '')
+    initialiser_application()
+    try:
+        # Une requête en lecture ne crée pas de fichier pour une classe inconnue
+        g.bot = classes.obtenir(g.classe, creer=request.method not in ('GET', 'HEAD'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    g.bot.synchroniser()
+
+
+@app.after_request
+def mesurer_requete(response):
+    debut = getattr(g, 'debut_requete', None)
+    if debut is not None:
+        route = request.url_rule.rule if request.url_rule else 'inconnue'
+        metriques.observer('chatbot_requete_duree_secondes', time.perf_counter() - debut,
+                           (('route', route),))
+        metriques.incrementer('chatbot_requetes_total',
+                              (('route', route), ('methode', request.method), ('statut', response.status_code)))
+    return response
+
+
+def reponse_revalidable(response, etag):
+    """Ajoute l'ETag et répond 304 si le client a déjà cette version"""
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    encodage = 'identity'
+    for candidat in ('br', 'gzip'):
+        if candidat in HTML_VARIANTES and request.accept_encodings[candidat]:
+            encodage = candidat
+            break
+
+    response = Response(HTML_VARIANTES[encodage], mimetype='text/html')
+    if encodage != 'identity':
+        response.headers['Content-Encoding'] = encodage
+    response.vary.add('Accept-Encoding')
+    response.last_modified = HTML_DATE
+    return reponse_revalidable(response, f'{HTML_ETAG}-{encodage}')
 
 
 @app.route('/get_mode')
 def get_mode():
-    return jsonify({'mode': bot.mode})
+    return reponse_revalidable(jsonify({'mode': g.bot.mode}), f'mode-{g.classe}-{g.bot.mode}')
 
 
 @app.route('/changer_mode', methods=['POST'])
@@ -822,7 +1925,7 @@ def changer_mode():
         data = request.get_json()
         nouveau_mode = data.get('mode', '')
 
-        if bot.changer_mode(nouveau_mode):
+        if g.bot.changer_mode(nouveau_mode):
             return jsonify({
                 'success': True,
                 'message': f'Mode changé en: {nouveau_mode}'
@@ -841,19 +1944,20 @@ def chat():
         if not message:
             return jsonify({'error': 'Message vide'}), 400
 
-        resultat = bot.trouver_reponse(message)
+        with profiler_requete('chat', message):
+            resultat = g.bot.trouver_reponse(message)
 
         if resultat:
             return jsonify({
                 'reponse': resultat['reponse'],
                 'type': resultat['type'],
-                'statistiques': bot.get_statistiques()
+                'statistiques': g.bot.get_statistiques()
             })
         else:
             return jsonify({
                 'reponse': "Je ne sais pas répondre à ça. Peux-tu m'apprendre ?",
                 'type': 'apprentissage',
-                'statistiques': bot.get_statistiques()
+                'statistiques': g.bot.get_statistiques()
             })
     except Exception as e:
         return jsonify({'error': f'Erreur: {str(e)}'}), 500
@@ -868,12 +1972,14 @@ def feedback():
         positif = data.get('positif', True)
 
         if question and reponse:
-            if bot.donner_feedback(positif):
+            with profiler_requete('feedback', question):
+                succes = g.bot.enregistrer_feedback(positif)
+            if succes:
                 message = "Merci ! J'ai noté ton feedback." if positif else "D'accord, je vais éviter cette réponse."
                 return jsonify({
                     'success': True,
                     'message': message,
-                    'statistiques': bot.get_statistiques()
+                    'statistiques': g.bot.get_statistiques()
                 })
         return jsonify({'success': False, 'message': 'Données invalides'})
     except Exception as e:
@@ -888,11 +1994,13 @@ def apprendre():
         reponse = data.get('reponse', '')
 
         if question and reponse:
-            if bot.apprendre_reponse(question, reponse):
+            with profiler_requete('apprendre', question):
+                succes = g.bot.apprendre_reponse(question, reponse)
+            if succes:
                 return jsonify({
                     'success': True,
                     'message': 'Super ! J\'ai appris quelque chose de nouveau !',
-                    'statistiques': bot.get_statistiques()
+                    'statistiques': g.bot.get_statistiques()
                 })
         return jsonify({'success': False, 'message': 'Question ou réponse manquante'})
     except Exception as e:
@@ -924,12 +2032,13 @@ def importer_base():
                 writer.writerow(['La Révolution française', '1789'])
 
         # Importer les données
-        nb_importes = bot.importer_csv(fichier_csv)
+        with profiler_requete('importer_base'):
+            nb_importes = g.bot.importer_csv(fichier_csv)
 
         return jsonify({
             'success': True,
             'message': f'Base importée avec succès ! {nb_importes} questions-réponses ajoutées.',
-            'statistiques': bot.get_statistiques()
+            'statistiques': g.bot.get_statistiques()
         })
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erreur: {str(e)}'})
@@ -937,7 +2046,46 @@ def importer_base():
 
 @app.route('/statistiques')
 def get_statistiques():
-    return jsonify(bot.get_statistiques())
+    # Les compteurs ne changent qu'avec une entrée du journal, donc avec la version
+    etag = f'stats-{g.classe}-{g.bot.version}-{g.bot.mode}'
+    return reponse_revalidable(jsonify(g.bot.get_statistiques()), etag)
+
+
+@app.route('/changements')
+def changements():
+    """Questions modifiées depuis la version `depuis` (pour les caches et index externes)"""
+    depuis = request.args.get('depuis', 0, type=int)
+    questions = g.bot.changements_depuis(depuis)
+    if questions is None:
+        return jsonify({'version': g.bot.version, 'rechargement_complet': True})
+    return jsonify({'version': g.bot.version, 'rechargement_complet': False, 'questions': questions})
+
+
+@app.route('/questions_sans_reponse')
+def questions_sans_reponse():
+    """Questions inconnues les plus fréquentes (à apprendre en priorité)"""
+    limite = request.args.get('limite', 20, type=int)
+    return jsonify({
+        'total': g.bot.questions_sans_reponse,
+        'questions': g.bot.questions_frequentes_sans_reponse(limite)
+    })
+
+
+@app.route('/metrics')
+def exposer_metriques():
+    """Métriques au format texte Prometheus"""
+    stats = g.bot.get_statistiques()
+    jauges = {
+        'chatbot_base_questions': stats['questions'],
+        'chatbot_base_reponses': stats['reponses'],
+        'chatbot_base_score_moyen': stats['score_moyen'],
+        'chatbot_feedbacks_positifs': stats['feedbacks_positifs'],
+        'chatbot_feedbacks_negatifs': stats['feedbacks_negatifs'],
+        'chatbot_questions_sans_reponse': stats['questions_sans_reponse'],
+        'chatbot_classes_chargees': len(classes.classes),
+        'chatbot_classes_octets': classes.taille_totale(),
+    }
+    return Response(metriques.exporter(jauges), mimetype='text/plain; version=0.0.4')
 
 
 # =============================================
@@ -945,9 +2093,7 @@ def get_statistiques():
 # =============================================
 
 def demarrer():
-    with open('templates/index.html', 'w', encoding='utf-8') as f:
-        f.write(HTML_INTERFACE)
-
+    initialiser_application()
     print("\n" + "=" * 60)
     print("🚀 CHATBOT AVEC POP-UP AUTOMATIQUE - PRÊT !")
     print("=" * 60)